@@ -1,6 +1,7 @@
 from typing import Union, Optional
 from dto import Segment, Point
-from utils import classify_and_split
+from grid import SegmentGrid
+from utils import classify_and_split, point_side
 import tqdm
 
 
@@ -40,18 +41,44 @@ class BSPLeaf:
 
 class BSP:
     def __init__(
-        self, segments: list[Segment], max_depth: int = 20, min_segments: int = 2
+        self,
+        segments: list[Segment],
+        max_depth: int = 20,
+        min_segments: int = 2,
+        spatial_hash: bool = False,
+        grid_min_segments: int = 256,
+        progress: bool = True,
     ):
         self.segments = segments
         self.steps = []  # used for animation
         self.max_depth = max_depth
         self.min_segments = min_segments
+        # bucket segments into a grid when scoring nodes with many segments
+        self.spatial_hash = spatial_hash
+        self.grid_min_segments = grid_min_segments
+        self.progress = progress  # show tqdm bars while choosing partitions
         self.root = None
         self.depth = 0
 
     def build(self, method: str = "score"):
         self.root = self._build_bsp(self.segments, 0, method=method)
 
+    def locate(self, point: Point) -> BSPLeaf:
+        """
+        Walk down the tree and return the leaf containing the point. Points
+        lying on a partition line go to the front, same as classify_and_split.
+        """
+        if self.root is None:
+            raise RuntimeError("BSP tree is not built yet")
+
+        node = self.root
+        while isinstance(node, BSPNode):
+            if point_side(point, node.partition) >= 0:
+                node = node.front
+            else:
+                node = node.back
+        return node
+
     def _build_bsp(
         self,
         segments: list[Segment],
@@ -106,24 +133,34 @@ class BSP:
 
         # more complex heuristic: choose the longest segment as the partition line
         if method == "score":
+            grid = None
+            if self.spatial_hash and len(segments) >= self.grid_min_segments:
+                grid = SegmentGrid(segments)
+
             partition = segments[0]
             best_split_score = 999999
             for candi in tqdm.tqdm(
-                segments, desc="Choosing partition line", unit="candi"
+                segments,
+                desc="Choosing partition line",
+                unit="candi",
+                disable=not self.progress,
             ):
-                score = 0
-                front_count = 0
-                back_count = 0
-                for seg in segments:
-                    if seg == candi:
-                        continue
-                    result = classify_and_split(seg, candi)
-                    if result == "split":
-                        score += 1
-                    elif result == "front":
-                        front_count += 1
-                    elif result == "back":
-                        back_count += 1
+                if grid is not None:
+                    score, front_count, back_count = grid.count_sides(candi)
+                else:
+                    score = 0
+                    front_count = 0
+                    back_count = 0
+                    for seg in segments:
+                        if seg == candi:
+                            continue
+                        result = classify_and_split(seg, candi)
+                        if result == "split":
+                            score += 1
+                        elif result == "front":
+                            front_count += 1
+                        elif result == "back":
+                            back_count += 1
                 score += abs(front_count - back_count)  # balance
 
                 if score < best_split_score:
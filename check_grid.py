@@ -0,0 +1,109 @@
+"""
+Check that SegmentGrid.count_sides gives the same counts as classifying
+every segment, and that building with spatial_hash picks the same
+partitions. Run after touching grid.py (eps, _x_range clamping, ...):
+
+    python check_grid.py [map files...]
+"""
+
+import random
+import sys
+
+from bsp import BSP
+from dto import Point, Segment
+from grid import SegmentGrid
+from utils import classify_and_split, load_segments_from_file
+
+
+def exact_counts(segments: list[Segment], partition: Segment) -> tuple[int, int, int]:
+    """same loop as the "score" method in BSP._choose_partition_line"""
+    split_count = front_count = back_count = 0
+    for seg in segments:
+        if seg == partition:
+            continue
+        result = classify_and_split(seg, partition)
+        if result == "split":
+            split_count += 1
+        elif result == "front":
+            front_count += 1
+        elif result == "back":
+            back_count += 1
+    return split_count, front_count, back_count
+
+
+def check_counts(name: str, segments: list[Segment], bucket_size: int = 8) -> bool:
+    grid = SegmentGrid(segments, bucket_size)
+    for candi in segments:
+        got, want = grid.count_sides(candi), exact_counts(segments, candi)
+        if got != want:
+            print(f"FAIL {name}: {candi} grid={got} exact={want}")
+            return False
+    print(f"ok   {name}: {len(segments)} candidates")
+    return True
+
+
+def check_steps(name: str, segments: list[Segment]) -> bool:
+    steps = []
+    for spatial_hash in (False, True):
+        bsp = BSP(
+            segments,
+            min_segments=10,
+            spatial_hash=spatial_hash,
+            grid_min_segments=1,
+            progress=False,
+        )
+        bsp.build(method="score")
+        steps.append([seg.seg_id for seg in bsp.steps])
+    if steps[0] != steps[1]:
+        print(f"FAIL {name}: partitions differ with spatial_hash")
+        return False
+    print(f"ok   {name}: same {len(steps[0])} partitions")
+    return True
+
+
+def degenerate_layouts() -> dict[str, list[Segment]]:
+    rng = random.Random(0)
+
+    def seg(x1, y1, x2, y2):
+        return Segment(Point(x1, y1), Point(x2, y2), seg_id=str(rng.random()))
+
+    def pick():
+        return rng.randint(0, 6)
+
+    return {
+        "all vertical": [seg(3, pick(), 3, pick()) for _ in range(60)],
+        "all horizontal": [seg(pick(), 2, pick(), 2) for _ in range(60)],
+        "parallel verticals": [seg(x, 0, x, 5) for x in range(8) for _ in range(4)],
+        "grid aligned": [seg(pick(), pick(), pick(), pick()) for _ in range(80)],
+        "zero length": [seg(x, x, x, x) for x in range(5)]
+        + [seg(pick(), pick(), pick(), pick()) for _ in range(40)],
+        "random": [
+            seg(*(rng.uniform(-1e3, 1e3) for _ in range(4))) for _ in range(300)
+        ],
+        "near horizontal": [
+            seg(pick() * 15, y, pick() * 15, y + rng.uniform(-1e-6, 1e-6))
+            for y in (rng.uniform(0, 100) for _ in range(200))
+        ],
+        "large offset": [
+            seg(1e7 + rng.uniform(0, 10), rng.uniform(0, 10), 1e7, 5)
+            for _ in range(60)
+        ],
+    }
+
+
+def main():
+    maps = sys.argv[1:] or ["files/test.txt", "files/e1m1.txt"]
+    ok = True
+    for path in maps:
+        segments = load_segments_from_file(path)
+        ok &= check_counts(path, segments)
+        ok &= check_counts(f"{path} (bucket 1)", segments, bucket_size=1)
+        ok &= check_steps(path, segments)
+    for name, segments in degenerate_layouts().items():
+        for bucket_size in (1, 8):
+            ok &= check_counts(f"{name} (bucket {bucket_size})", segments, bucket_size)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
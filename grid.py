@@ -0,0 +1,192 @@
+from math import floor, sqrt
+from typing import Optional
+from dto import Point, Segment
+from utils import classify_and_split, point_side
+
+
+class SegmentGrid:
+    """
+    Uniform grid over the segments of one BSP node, used to count how a
+    candidate partition line classifies them without visiting every segment.
+
+    Each segment is registered in every cell it passes through, and counted
+    once in the cell holding its start point (its "home" cell). For a
+    candidate line, only segments registered in cells the line crosses are
+    classified exactly; every other segment lies strictly on one side of the
+    line, so the front/back counts come from per-row prefix sums of the
+    home cells on either side of the crossed cells. The result is the same
+    as classifying every segment with classify_and_split.
+    """
+
+    def __init__(self, segments: list[Segment], bucket_size: int = 8):
+        self.segments = segments
+
+        xs = [p.x for seg in segments for p in (seg.start, seg.end)]
+        ys = [p.y for seg in segments for p in (seg.start, seg.end)]
+        self.min_x, self.min_y = min(xs), min(ys)
+        width, height = max(xs) - self.min_x, max(ys) - self.min_y
+
+        num_cells = max(1, len(segments) // bucket_size)
+        if width > 0 and height > 0:
+            self.cols = max(1, round(sqrt(num_cells * width / height)))
+            self.rows = max(1, round(num_cells / self.cols))
+        elif width > 0:
+            self.cols, self.rows = num_cells, 1
+        elif height > 0:
+            self.cols, self.rows = 1, num_cells
+        else:
+            self.cols, self.rows = 1, 1
+        self.cell_w = width / self.cols if width > 0 else 1.0
+        self.cell_h = height / self.rows if height > 0 else 1.0
+
+        # tolerance so cells touching a line within rounding error count as crossed
+        scale = max(width, height, *map(abs, xs), *map(abs, ys), 1.0)
+        self.eps = scale * 1e-9
+
+        self.cells = [[] for _ in range(self.rows * self.cols)]
+        self.home = []  # segment index -> (row, col) of its start point
+        home_counts = [[0] * self.cols for _ in range(self.rows)]
+        for idx, seg in enumerate(segments):
+            home = self._cell_of(seg.start)
+            self.home.append(home)
+            home_counts[home[0]][home[1]] += 1
+
+            cells = {home}
+            for row, (c0, c1) in self._line_cells(seg.start, seg.end, True).items():
+                cells.update((row, col) for col in range(c0, c1 + 1))
+            for row, col in cells:
+                self.cells[row * self.cols + col].append(idx)
+
+        # prefix[row][col] = number of segments whose home is left of col
+        self.prefix = []
+        for counts in home_counts:
+            row_prefix = [0]
+            for count in counts:
+                row_prefix.append(row_prefix[-1] + count)
+            self.prefix.append(row_prefix)
+
+    def count_sides(self, partition: Segment) -> tuple[int, int, int]:
+        """
+        Return (split, front, back) counts of the segments against the
+        partition line, skipping the partition itself.
+        """
+        split_count = front_count = back_count = 0
+        p1, p2 = partition.start, partition.end
+        if p1.x == p2.x and p1.y == p2.y:
+            # degenerate line, every point is on it
+            return 0, sum(seg != partition for seg in self.segments), 0
+
+        ranges = self._line_cells(p1, p2, False)
+
+        def add_side(count: int, row: int, col: int):
+            nonlocal front_count, back_count
+            if point_side(self._cell_center(row, col), partition) > 0:
+                front_count += count
+            else:
+                back_count += count
+
+        exact = set()
+        for row in range(self.rows):
+            row_prefix = self.prefix[row]
+            crossed = ranges.get(row)
+            if crossed is None:
+                add_side(row_prefix[-1], row, 0)
+                continue
+
+            c0, c1 = crossed
+            if c0 > 0:
+                add_side(row_prefix[c0], row, c0 - 1)
+            if c1 < self.cols - 1:
+                add_side(row_prefix[-1] - row_prefix[c1 + 1], row, c1 + 1)
+            for col in range(c0, c1 + 1):
+                exact.update(self.cells[row * self.cols + col])
+
+        for idx in exact:
+            seg = self.segments[idx]
+
+            # already counted on its home's side if the home cell is not crossed
+            row, col = self.home[idx]
+            crossed = ranges.get(row)
+            if crossed is None or not crossed[0] <= col <= crossed[1]:
+                if point_side(seg.start, partition) > 0:
+                    front_count -= 1
+                else:
+                    back_count -= 1
+
+            if seg == partition:
+                continue
+            result = classify_and_split(seg, partition)
+            if result == "split":
+                split_count += 1
+            elif result == "front":
+                front_count += 1
+            elif result == "back":
+                back_count += 1
+
+        return split_count, front_count, back_count
+
+    def _cell_of(self, point: Point) -> tuple[int, int]:
+        col = floor((point.x - self.min_x) / self.cell_w)
+        row = floor((point.y - self.min_y) / self.cell_h)
+        return min(max(row, 0), self.rows - 1), min(max(col, 0), self.cols - 1)
+
+    def _cell_center(self, row: int, col: int) -> Point:
+        return Point(
+            self.min_x + (col + 0.5) * self.cell_w,
+            self.min_y + (row + 0.5) * self.cell_h,
+        )
+
+    def _line_cells(
+        self, p1: Point, p2: Point, clip: bool
+    ) -> dict[int, tuple[int, int]]:
+        """
+        Map each row to the (first, last) column of the cells touched by the
+        line through p1 and p2, or by the segment itself if clip is True.
+        Rows the line misses are left out.
+        """
+        eps = self.eps
+        dx, dy = p2.x - p1.x, p2.y - p1.y
+        ranges = {}
+
+        rows = range(self.rows)
+        if clip:
+            first = floor((min(p1.y, p2.y) - eps - self.min_y) / self.cell_h)
+            last = floor((max(p1.y, p2.y) + eps - self.min_y) / self.cell_h)
+            rows = range(max(first, 0), min(last, self.rows - 1) + 1)
+
+        for row in rows:
+            lo = self.min_y + row * self.cell_h - eps
+            hi = self.min_y + (row + 1) * self.cell_h + eps
+            if clip:
+                lo, hi = max(lo, min(p1.y, p2.y)), min(hi, max(p1.y, p2.y))
+                if lo > hi:
+                    continue
+
+            x_range = self._x_range(p1, dx, dy, lo, hi, clip)
+            if x_range is None:
+                continue
+            # clamp so near-horizontal lines don't overflow floor()
+            x0 = max(x_range[0], self.min_x - self.cell_w)
+            x1 = min(x_range[1], self.min_x + (self.cols + 1) * self.cell_w)
+            c0 = floor((x0 - eps - self.min_x) / self.cell_w)
+            c1 = floor((x1 + eps - self.min_x) / self.cell_w)
+            if c1 < 0 or c0 >= self.cols:
+                continue
+            ranges[row] = (max(c0, 0), min(c1, self.cols - 1))
+
+        return ranges
+
+    def _x_range(
+        self, p1: Point, dx: float, dy: float, lo: float, hi: float, clip: bool
+    ) -> Optional[tuple[float, float]]:
+        """x extent of the line (or segment) within the band lo <= y <= hi."""
+        if dy == 0:
+            if not lo <= p1.y <= hi:
+                return None
+            if clip:
+                return min(p1.x, p1.x + dx), max(p1.x, p1.x + dx)
+            return self.min_x, self.min_x + self.cols * self.cell_w
+
+        x_lo = p1.x + (lo - p1.y) * dx / dy
+        x_hi = p1.x + (hi - p1.y) * dx / dy
+        return min(x_lo, x_hi), max(x_lo, x_hi)
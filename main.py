@@ -1,26 +1,9 @@
 from bsp import BSP
-from dto import Point, Segment
+from dto import Point
+from utils import load_segments_from_file
 from visualizer import Visualizer
 
 
-def load_segments_from_file(filename: str):
-    segments = []
-    idx = 0
-    with open(filename, "r", encoding="utf-8") as f:
-        for line in f:
-            if line.strip().startswith("#") or not line.strip():
-                continue
-            x1, y1, x2, y2 = map(float, line.strip().split())
-            # force line is left to right and up to down
-            if (x1 > x2) or (x1 == x2 and y1 > y2):
-                x1, y1, x2, y2 = x2, y2, x1, y1
-
-            seg = Segment(Point(x1, y1), Point(x2, y2), seg_id=str(idx))
-            segments.append(seg)
-            idx += 1
-    return segments
-
-
 def main():
     # ask which file to load
     print("Select a file to load:\n")
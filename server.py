@@ -0,0 +1,454 @@
+"""
+Long-running BSP query service.
+
+Reads one JSON request per line from stdin and writes one JSON response per
+line to stdout, so no network is needed. Built trees are kept in an LRU cache
+bounded by their estimated memory size, and missing maps are built in the
+background.
+
+Requests:
+    {"id": 1, "op": "load", "map": "files/e1m1.txt"}
+    {"id": 2, "op": "locate", "map": "files/e1m1.txt", "points": [[1056, -3616]]}
+    {"id": 3, "op": "segments", "map": "files/e1m1.txt", "points": [[1056, -3616]]}
+    {"id": 4, "op": "stats"}
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from math import isfinite
+from typing import Optional
+
+from bsp import BSP, BSPLeaf, BSPNode
+from dto import Point, Segment
+from utils import load_segments_from_file
+
+OPS = ("load", "locate", "segments", "stats")
+
+
+class CachedTree:
+    def __init__(self, bsp: BSP, build_time: float):
+        self.bsp = bsp
+        self.build_time = build_time
+        self.leaf_ids = {}  # id(leaf) -> leaf index, in front-first order
+        self.size_bytes = _estimate_tree_bytes(bsp, self.leaf_ids)
+
+    def __repr__(self):
+        return f"CachedTree(leaves={len(self.leaf_ids)}, size_bytes={self.size_bytes})"
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0  # lookups that started a build, including prefetches
+        self.waits = 0  # lookups on a map that was already building
+        self.evictions = 0
+        self.builds = 0
+        self.build_errors = 0
+        self.build_seconds = 0.0
+        self.latency = {}  # op -> {"count", "total_ms", "max_ms"}
+
+    def record_latency(self, op: str, seconds: float):
+        ms = seconds * 1000.0
+        with self.lock:
+            stat = self.latency.setdefault(
+                op, {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+            )
+            stat["count"] += 1
+            stat["total_ms"] += ms
+            stat["max_ms"] = max(stat["max_ms"], ms)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses + self.waits
+            latency = {
+                op: {
+                    "count": stat["count"],
+                    "avg_ms": stat["total_ms"] / stat["count"],
+                    "max_ms": stat["max_ms"],
+                }
+                for op, stat in self.latency.items()
+            }
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "builds": self.builds,
+                "build_errors": self.build_errors,
+                "build_seconds": self.build_seconds,
+                "latency": latency,
+            }
+
+
+class TreeCache:
+    """
+    LRU cache of built BSP trees keyed by map path. The total estimated size
+    is kept under max_bytes by evicting the least recently used trees; the
+    most recent tree is always kept even if it alone is over the budget.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        metrics: Metrics,
+        workers: int = 1,
+        max_depth: int = 20,
+        min_segments: int = 10,
+        method: str = "score",
+        spatial_hash: bool = False,
+    ):
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self.max_depth = max_depth
+        self.min_segments = min_segments
+        self.method = method
+        self.spatial_hash = spatial_hash
+        self.total_bytes = 0
+        self.trees = OrderedDict()  # map path -> CachedTree
+        self.pending = {}  # map path -> Future of CachedTree
+        self.failed = {}  # map path -> error of its last failed build
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bsp-build"
+        )
+
+    def lookup(self, path: str) -> Future:
+        """Return a future of the tree for a map, starting a build if needed."""
+        return self._lookup(path)
+
+    def prefetch(self, path: str) -> tuple[str, Optional[str]]:
+        """
+        Start building a map in the background and return its status
+        ("cached", "building" or "error") with the build error, if any. A map
+        whose last build failed is not rebuilt here; queries still retry it.
+        """
+        path = os.path.normpath(path)
+        with self.lock:
+            error = self.failed.get(path)
+            if error is not None and path not in self.pending:
+                return "error", error
+
+        future = self._lookup(path, count=False)
+        if not future.done():
+            return "building", None
+        if future.exception() is not None:
+            return "error", _format_error(future.exception())
+        return "cached", None
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def _lookup(self, path: str, count: bool = True) -> Future:
+        """count=False skips the hit/wait counters, e.g. for prefetches."""
+        path = os.path.normpath(path)
+        with self.lock:
+            tree = self.trees.get(path)
+            if tree is not None:
+                self.trees.move_to_end(path)
+                if count:
+                    with self.metrics.lock:
+                        self.metrics.hits += 1
+                future = Future()
+                future.set_result(tree)
+                return future
+
+            future = self.pending.get(path)
+            if future is not None:
+                if count:
+                    with self.metrics.lock:
+                        self.metrics.waits += 1
+                return future
+
+            # a build is a miss whether a query or a prefetch started it
+            with self.metrics.lock:
+                self.metrics.misses += 1
+            future = self.executor.submit(self._build, path)
+            self.pending[path] = future
+            return future
+
+    def _build(self, path: str) -> CachedTree:
+        try:
+            start = time.perf_counter()
+            bsp = BSP(
+                load_segments_from_file(path),
+                max_depth=self.max_depth,
+                min_segments=self.min_segments,
+                spatial_hash=self.spatial_hash,
+                progress=False,
+            )
+            bsp.build(method=self.method)
+            tree = CachedTree(bsp, time.perf_counter() - start)
+        except Exception as e:
+            with self.lock:
+                self.pending.pop(path, None)
+                self.failed[path] = _format_error(e)
+            with self.metrics.lock:
+                self.metrics.build_errors += 1
+            raise
+
+        with self.metrics.lock:
+            self.metrics.builds += 1
+            self.metrics.build_seconds += tree.build_time
+
+        with self.lock:
+            self.pending.pop(path, None)
+            self.failed.pop(path, None)
+            self.trees[path] = tree
+            self.total_bytes += tree.size_bytes
+            while self.total_bytes > self.max_bytes and len(self.trees) > 1:
+                _, evicted = self.trees.popitem(last=False)
+                self.total_bytes -= evicted.size_bytes
+                with self.metrics.lock:
+                    self.metrics.evictions += 1
+        return tree
+
+
+class Server:
+    def __init__(self, cache: TreeCache, metrics: Metrics, workers: int = 4):
+        self.cache = cache
+        self.metrics = metrics
+        self.write_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bsp-query"
+        )
+
+    def serve(self, infile=sys.stdin, outfile=sys.stdout):
+        """
+        Handle requests until EOF. "stats" and "load" are answered right away;
+        queries are answered on the query pool once their map's tree is
+        ready, so a map that is still building never holds up other requests.
+        Responses may come out of order; match them with the "id" field.
+        """
+        for line in infile:
+            if not line.strip():
+                continue
+            self._dispatch(line, outfile)
+        # finish builds first, their callbacks still submit queries
+        self.cache.shutdown()
+        self.executor.shutdown(wait=True)
+
+    def handle(self, request: dict) -> dict:
+        """Answer a "stats" or "load" request."""
+        op = request.get("op")
+        if op == "stats":
+            stats = self.metrics.snapshot()
+            with self.cache.lock:
+                stats["cached_maps"] = list(self.cache.trees)
+                stats["building_maps"] = list(self.cache.pending)
+                stats["failed_maps"] = dict(self.cache.failed)
+                stats["cache_bytes"] = self.cache.total_bytes
+                stats["cache_max_bytes"] = self.cache.max_bytes
+            return {"stats": stats}
+
+        if op == "load":
+            status, error = self.cache.prefetch(request["map"])
+            if error is not None:
+                return {"ok": False, "status": status, "error": error}
+            return {"status": status}
+
+        raise ValueError(f"Unknown op: {op}")
+
+    def query(self, op: str, tree: CachedTree, points: list[Point]) -> dict:
+        """Answer a "locate" or "segments" request against a built tree."""
+        leaves = [tree.bsp.locate(point) for point in points]
+        response = {"leaves": [tree.leaf_ids[id(leaf)] for leaf in leaves]}
+        if op == "segments":
+            response["segments"] = [
+                [_segment_to_json(seg) for seg in leaf.segments] for leaf in leaves
+            ]
+        return response
+
+    def _dispatch(self, line: str, outfile):
+        start = time.perf_counter()
+        request_id = None
+        op = "invalid"
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            request_id = request.get("id")
+            if request.get("op") not in OPS:
+                raise ValueError(f"Unknown op: {request.get('op')}")
+            op = request["op"]
+            if op != "stats" and "map" not in request:
+                raise ValueError("missing 'map'")
+
+            if op == "locate" or op == "segments":
+                points = _parse_points(request.get("points", []))
+                future = self.cache.lookup(request["map"])
+                future.add_done_callback(
+                    lambda f: self.executor.submit(
+                        self._answer_query, f, request_id, op, points, start, outfile
+                    )
+                )
+                return
+
+            response = {"id": request_id, "ok": True, **self.handle(request)}
+        except Exception as e:
+            response = _error_response(request_id, e)
+        self._reply(response, op, start, outfile)
+
+    def _answer_query(
+        self,
+        future: Future,
+        request_id,
+        op: str,
+        points: list[Point],
+        start: float,
+        outfile,
+    ):
+        try:
+            response = {
+                "id": request_id,
+                "ok": True,
+                **self.query(op, future.result(), points),
+            }
+        except Exception as e:
+            response = _error_response(request_id, e)
+        self._reply(response, op, start, outfile)
+
+    def _reply(self, response: dict, op: str, start: float, outfile):
+        self.metrics.record_latency(op, time.perf_counter() - start)
+        with self.write_lock:
+            outfile.write(json.dumps(response) + "\n")
+            outfile.flush()
+
+
+def _error_response(request_id, error: Exception) -> dict:
+    return {"id": request_id, "ok": False, "error": _format_error(error)}
+
+
+def _format_error(error: BaseException) -> str:
+    return f"{type(error).__name__}: {error}"
+
+
+def _parse_points(raw) -> list[Point]:
+    if not isinstance(raw, list):
+        raise ValueError("'points' must be a list of [x, y] pairs")
+    points = []
+    for pair in raw:
+        if not isinstance(pair, list) or len(pair) != 2:
+            raise ValueError(f"point must be an [x, y] pair: {pair!r}")
+        for v in pair:
+            # bool is an int subclass, but true/false are not coordinates
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                raise ValueError(f"point coordinates must be numbers: {pair!r}")
+            if not isfinite(v):
+                raise ValueError(f"point coordinates must be finite: {pair!r}")
+        points.append(Point(float(pair[0]), float(pair[1])))
+    return points
+
+
+def _segment_to_json(seg: Segment) -> dict:
+    return {
+        "id": seg.seg_id,
+        "start": [seg.start.x, seg.start.y],
+        "end": [seg.end.x, seg.end.y],
+    }
+
+
+def _estimate_tree_bytes(bsp: BSP, leaf_ids: dict) -> int:
+    """
+    Rough memory size of a built BSP: its own segment lists plus the tree.
+    Objects shared between lists are counted once. Fills leaf_ids.
+    """
+    seen = set()
+    return (
+        _object_bytes(bsp)
+        + _segments_bytes(bsp.segments, seen)
+        + _segments_bytes(bsp.steps, seen)
+        + _node_bytes(bsp.root, leaf_ids, seen)
+    )
+
+
+def _node_bytes(node, leaf_ids: dict, seen: set) -> int:
+    if isinstance(node, BSPLeaf):
+        leaf_ids[id(node)] = len(leaf_ids)
+        return _object_bytes(node) + _segments_bytes(node.segments, seen)
+
+    if isinstance(node, BSPNode):
+        # seg_front/seg_back are the same lists as the children's segments
+        return (
+            _object_bytes(node)
+            + _segment_bytes(node.partition, seen)
+            + _segments_bytes(node.seg_front, seen)
+            + _segments_bytes(node.seg_back, seen)
+            + _node_bytes(node.front, leaf_ids, seen)
+            + _node_bytes(node.back, leaf_ids, seen)
+        )
+
+    return 0
+
+
+def _segments_bytes(segments: list[Segment], seen: set) -> int:
+    if id(segments) in seen:
+        return 0
+    seen.add(id(segments))
+    size = sys.getsizeof(segments)
+    for seg in segments:
+        size += _segment_bytes(seg, seen)
+    return size
+
+
+def _segment_bytes(seg: Segment, seen: set) -> int:
+    if id(seg) in seen:
+        return 0
+    seen.add(id(seg))
+    size = _object_bytes(seg) + sys.getsizeof(seg.seg_id)
+    for point in (seg.start, seg.end):
+        if id(point) not in seen:
+            seen.add(id(point))
+            size += _object_bytes(point) + 2 * sys.getsizeof(0.0)
+    return size
+
+
+def _object_bytes(obj) -> int:
+    return sys.getsizeof(obj) + sys.getsizeof(obj.__dict__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BSP query service (JSON lines)")
+    parser.add_argument(
+        "--cache-mb", type=float, default=256.0, help="tree cache budget in MB"
+    )
+    parser.add_argument("--build-workers", type=int, default=1)
+    parser.add_argument("--query-workers", type=int, default=4)
+    parser.add_argument("--max-depth", type=int, default=20)
+    parser.add_argument("--min-segments", type=int, default=10)
+    parser.add_argument("--method", choices=["score", "simple"], default="score")
+    parser.add_argument(
+        "--spatial-hash",
+        action="store_true",
+        help="score partition candidates with a segment grid (large maps)",
+    )
+    parser.add_argument(
+        "--preload", nargs="*", default=[], help="maps to build in the background"
+    )
+    args = parser.parse_args()
+
+    metrics = Metrics()
+    cache = TreeCache(
+        max_bytes=int(args.cache_mb * 1024 * 1024),
+        metrics=metrics,
+        workers=args.build_workers,
+        max_depth=args.max_depth,
+        min_segments=args.min_segments,
+        method=args.method,
+        spatial_hash=args.spatial_hash,
+    )
+    for path in args.preload:
+        cache.prefetch(path)
+
+    Server(cache, metrics, workers=args.query_workers).serve()
+
+
+if __name__ == "__main__":
+    main()
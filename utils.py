@@ -19,3 +19,21 @@ def point_side(point: Point, partition: Segment) -> float:
     (x, y) = point.x, point.y
     # use cross product to determine the side
     return (p2.x - p1.x) * (y - p1.y) - (p2.y - p1.y) * (x - p1.x)
+
+
+def load_segments_from_file(filename: str):
+    segments = []
+    idx = 0
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip().startswith("#") or not line.strip():
+                continue
+            x1, y1, x2, y2 = map(float, line.strip().split())
+            # force line is left to right and up to down
+            if (x1 > x2) or (x1 == x2 and y1 > y2):
+                x1, y1, x2, y2 = x2, y2, x1, y1
+
+            seg = Segment(Point(x1, y1), Point(x2, y2), seg_id=str(idx))
+            segments.append(seg)
+            idx += 1
+    return segments